@@ -4,22 +4,32 @@ from __future__ import print_function
 
 import argparse
 import errno
+import fcntl
 import hashlib
 import imp
 import inspect
 import json
+import marshal
+import multiprocessing
 import os
 import pexpect
 import pip
+import posixpath
+import re
 import requests
+import select
+import shlex
 import shutil
 import subprocess
 import sys
 import tempfile
+import termios
 import time
 import traceback
 import unittest
 import xml.etree.cElementTree as ET
+import zipfile
+import zipimport
 
 from backports.shutil_which import which
 from contextlib import contextmanager
@@ -32,6 +42,11 @@ try:
 except ImportError:
     from pipes import quote
 
+try:
+    from importlib.machinery import SourceFileLoader
+except ImportError:
+    SourceFileLoader = None
+
 import config
 
 __all__ = ["check", "Checks", "Child", "EOF", "Error", "File", "Mismatch", "valgrind"]
@@ -58,6 +73,14 @@ def main():
                         default="~/.local/share/check50",
                         help="specify directory containing the checks "
                              "(~/.local/share/check50 by default)")
+    parser.add_argument("--dev",
+                        action="store_true",
+                        help="run checks straight from the working tree in --checkdir, "
+                             "including uncommitted changes (implies --offline)")
+    parser.add_argument("--bundle",
+                        action="store",
+                        help="load checks from a bundle archive instead of a "
+                             "git repository (implies --offline)")
     parser.add_argument("--log",
                         action="store_true",
                         help="display more detailed information about check results")
@@ -70,6 +93,13 @@ def main():
     identifier = config.args.identifier[0]
     files = config.args.files
 
+    if config.args.dev:
+        config.args.offline = True
+
+    if config.args.bundle:
+        config.bundle = os.path.abspath(os.path.expanduser(config.args.bundle))
+        config.args.offline = True
+
     if config.args.offline:
         config.args.local = True
 
@@ -162,6 +192,8 @@ def cd(path):
 
 def cleanup():
     """Remove temporary files at end of test."""
+    while config.zygotes:
+        config.zygotes.popitem()[1][0].close(force=True)
     if config.tempdir:
         shutil.rmtree(config.tempdir)
 
@@ -177,6 +209,155 @@ def copy(src, dst):
             raise
 
 
+def extract(path, dst):
+    """Extract path (relative to config.check_dir) from config.bundle into dst, like copy"""
+    member = posixpath.normpath(posixpath.join(config.check_dir, path))
+    root = posixpath.dirname(member)
+    with zipfile.ZipFile(config.bundle) as bundle:
+        infos = [info for info in bundle.infolist()
+                 if info.filename == member or info.filename.startswith(member + "/")]
+        if not infos:
+            raise IOError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+
+        for info in infos:
+            target = os.path.join(dst, *info.filename[len(root):].strip("/").split("/"))
+            if info.filename.endswith("/"):
+                if not os.path.isdir(target):
+                    os.makedirs(target)
+                continue
+
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            with bundle.open(info) as src, open(target, "wb") as f:
+                shutil.copyfileobj(src, f)
+
+            # Preserve permissions (e.g., executable bits) as copy would.
+            mode = info.external_attr >> 16
+            if mode:
+                os.chmod(target, mode & 0o777)
+
+
+# Upper bound on how much load may stretch a timeout, so that e.g. a student's
+# infinite loop can't hold up a grading slot for minutes on an overloaded machine.
+MAX_LOAD_FACTOR = 3.0
+
+
+def load_factor():
+    """Returns how oversubscribed this machine currently is (at least 1)."""
+    try:
+        return max(1.0, os.getloadavg()[0] / multiprocessing.cpu_count())
+    except (AttributeError, NotImplementedError, OSError):
+        return 1.0
+
+
+def scale_timeout(timeout):
+    """
+    Scales timeout by the current load (up to MAX_LOAD_FACTOR) so busy machines
+    don't fail correct programs, returning the scaled timeout and the load
+    factor used. None
+    (wait forever) and negative timeouts (pexpect's default) are left as is.
+    """
+    if timeout is None or timeout < 0:
+        return timeout, 1.0
+    factor = min(load_factor(), MAX_LOAD_FACTOR)
+    return timeout * factor, factor
+
+
+def pty_spawn(command, args=[]):
+    """Spawns command in a new pty, returning the pexpect child."""
+    if sys.version_info < (3, 0):
+        child = pexpect.spawn(command, args, echo=False)
+    else:
+        child = pexpect.spawnu(command, args, encoding="utf-8", echo=False)
+
+    # pexpect sleeps before every send and after every close by default,
+    # which dominates the cost of checks that spawn many short-lived programs.
+    child.delaybeforesend = 0
+    child.delayafterclose = 0
+    # Newer versions of pexpect delegate closing to ptyprocess.
+    if hasattr(child, "ptyproc"):
+        child.ptyproc.delayafterclose = 0
+    return child
+
+
+def split_command(cmd):
+    """Split cmd into arguments if it can be run without a shell, otherwise return None."""
+    if any(c in cmd for c in "|&;<>()$`*?[]{}~!#\n"):
+        return None
+    try:
+        args = shlex.split(cmd)
+    except ValueError:
+        return None
+    if not args or "=" in args[0]:
+        return None
+    return args
+
+
+# Bootstrap for a pre-spawned Python interpreter. It waits for a line on stdin,
+# then runs the script described by the request file named by its argument.
+ZYGOTE = """
+import sys
+# Don't import the bootstrap's own modules from the current directory.
+del sys.path[0]
+preloaded = set(sys.modules)
+import json, os, runpy, traceback
+sys.stdin.readline()
+with open(sys.argv[1]) as f:
+    request = json.load(f)
+os.chdir(request["cwd"])
+os.environ.clear()
+os.environ.update(request["env"])
+sys.argv = request["argv"]
+path = os.path.abspath(sys.argv[0])
+sys.path.insert(0, os.path.dirname(path))
+
+# Forget the modules imported for the bootstrap so the script's own modules
+# (e.g., a json.py of its own) aren't shadowed by them.
+for name in set(sys.modules) - preloaded:
+    del sys.modules[name]
+
+try:
+    runpy.run_path(path, run_name="__main__")
+except SystemExit:
+    raise
+except BaseException:
+    etype, value, tb = sys.exc_info()
+    # Hide the bootstrap's own frames, as if the script had been run directly.
+    while tb is not None and tb.tb_frame.f_code.co_filename != path:
+        tb = tb.tb_next
+    traceback.print_exception(etype, value, tb)
+    sys.exit(1)
+"""
+
+
+def zygote(args):
+    """
+    Runs the Python script in args in an already started interpreter and
+    starts another one in its place, so that repeated spawns of the same
+    interpreter don't pay for its startup.
+    """
+    interpreter = args[0]
+    if interpreter not in config.zygotes:
+        config.zygotes[interpreter] = warm(interpreter)
+    child, request = config.zygotes.pop(interpreter)
+    if not child.isalive():
+        child, request = warm(interpreter)
+
+    with open(request, "w") as f:
+        json.dump({"argv": args[1:], "cwd": os.getcwd(), "env": dict(os.environ)}, f)
+    child.sendline("")
+
+    config.zygotes[interpreter] = warm(interpreter)
+    return child
+
+
+def warm(interpreter):
+    """Starts interpreter waiting on ZYGOTE, returning it and its request file."""
+    fd, request = tempfile.mkstemp(dir=config.tempdir)
+    os.close(fd)
+    return pty_spawn(interpreter, ["-c", ZYGOTE, request]), request
+
+
 def excepthook(cls, exc, tb):
     cleanup()
 
@@ -254,6 +435,9 @@ def import_checks(identifier):
     except ValueError:
         slug, repo = identifier, "cs50/checks"
 
+    if config.bundle:
+        return import_bundle(slug)
+
     try:
         org, repo = repo.split("/")
     except ValueError:
@@ -261,69 +445,329 @@ def import_checks(identifier):
             "expected repository to be of the form username/repository, but got \"{}\"".format(repo))
 
     checks_root = os.path.join(config.args.checkdir, org, repo)
+    try:
+        os.makedirs(os.path.dirname(checks_root))
+    except OSError:
+        if not os.path.isdir(os.path.dirname(checks_root)):
+            raise
+
+    # Many check50 processes may share checks_root, so only one at a time may update it.
+    if not config.args.dev:
+        started = time.time()
+        with lock(checks_root + ".lock"):
+            # Reuse the checks if another process updated them while we waited for the lock.
+            if not config.args.offline and (updated_at(checks_root) < started
+                                            or not os.path.exists(checks_root)):
+                update(org, repo, checks_root)
+
+            # Run against a copy of this revision that later updates won't touch.
+            checks_root = snapshot(checks_root)
+
     config.check_dir = os.path.join(checks_root, slug.replace("/", os.sep), "check50")
 
-    if not config.args.offline:
-        if os.path.exists(checks_root):
-            command = ["git", "-C", checks_root, "pull", "origin", "master"]
+    # Install any dependencies from requirements.txt either in the root of the
+    # repository or in the directory of the specific check, one process at a time.
+    with lock(os.path.join(config.args.checkdir, ".install.lock")):
+        for dir in [checks_root, os.path.dirname(config.check_dir)]:
+            requirements = os.path.join(dir, "requirements.txt")
+            if os.path.exists(requirements):
+                install_requirements(requirements)
 
-        else:
-            command = ["git", "clone", "https://github.com/{}/{}".format(org, repo), checks_root]
+    return load_checks(slug)
 
-        # Can't use subprocess.DEVNULL because it requires python 3.3.
-        stdout = stderr = None if config.args.verbose else open(os.devnull, "wb")
 
-        # Update checks via git.
+def lock(path):
+    """
+    Returns path opened and exclusively locked. Closing the file (e.g., at the
+    end of a `with` statement) releases the lock.
+    """
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX)
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+
+def update(org, repo, checks_root):
+    """
+    Clone or pull github.com/org/repo into checks_root, recording the revision
+    and time of the update in checks_root.updated. Must be called with
+    checks_root locked.
+    """
+    if os.path.exists(checks_root):
+        command = ["git", "-C", checks_root, "pull", "origin", "master"]
+
+    else:
+        command = ["git", "clone", "https://github.com/{}/{}".format(org, repo), checks_root]
+
+    # Can't use subprocess.DEVNULL because it requires python 3.3.
+    stdout = stderr = None if config.args.verbose else open(os.devnull, "wb")
+
+    # Update checks via git.
+    try:
+        subprocess.check_call(command, stdout=stdout, stderr=stderr)
+    except subprocess.CalledProcessError:
+        raise InternalError("failed to clone checks")
+
+    with open(checks_root + ".updated", "w") as f:
+        json.dump({"revision": revision(checks_root), "time": time.time()}, f)
+
+
+def updated_at(checks_root):
+    """Returns when checks_root was last updated successfully, or 0 if unknown."""
+    try:
+        with open(checks_root + ".updated") as f:
+            return json.load(f)["time"]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return 0
+
+
+def revision(checks_root):
+    """Returns the revision checked out in checks_root, or None if it isn't a git repository."""
+    try:
+        with open(os.devnull, "wb") as devnull:
+            return subprocess.check_output(["git", "-C", checks_root, "rev-parse", "HEAD"],
+                                           stderr=devnull).decode("utf-8").strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def snapshot(checks_root):
+    """
+    Returns a copy of checks_root at its current revision under
+    config.args.checkdir/.snapshots, creating it if need be. Must be called
+    with checks_root locked.
+    """
+    rev = revision(checks_root)
+    if rev is None:
+        return checks_root
+
+    path = os.path.join(config.args.checkdir, ".snapshots",
+                        os.path.relpath(checks_root, config.args.checkdir), rev)
+    if not os.path.isdir(path):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        # Copy into place atomically so that no one sees a partial snapshot.
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(path))
         try:
-            subprocess.check_call(command, stdout=stdout, stderr=stderr)
-        except subprocess.CalledProcessError:
-            raise InternalError("failed to clone checks")
+            shutil.copytree(checks_root, os.path.join(tmp, rev),
+                            ignore=shutil.ignore_patterns(".git"))
+            os.rename(os.path.join(tmp, rev), path)
+        finally:
+            shutil.rmtree(tmp)
+    return path
 
-    # Install any dependencies from requirements.txt either in the root of the
-    # repository or in the directory of the specific check.
-    for dir in [checks_root, os.path.dirname(config.check_dir)]:
-        requirements = os.path.join(dir, "requirements.txt")
-        if os.path.exists(requirements):
-            args = ["install", "-r", requirements]
-            # If we are not in a virtualenv, we need --user
-            if not hasattr(sys, "real_prefix"):
-                args.append("--user")
-
-            if not config.args.verbose:
-                args += ["--quiet"] * 3
 
-            try:
-                code = pip.main(args)
-            except SystemExit as e:
-                code = e.code
+def install_requirements(requirements):
+    """Install requirements with pip unless this interpreter already installed them."""
+    with open(requirements, "rb") as f:
+        stamp = install_stamp("requirements", hashlib.sha256(f.read()))
+    if os.path.exists(stamp):
+        return
+
+    install(["-r", requirements], requirements[len(config.args.checkdir) + 1:])
+    touch(stamp)
+
+
+def install_stamp(kind, sha256):
+    """Returns the file marking that the dependencies hashed by sha256 are installed for this interpreter."""
+    sha256.update(sys.executable.encode("utf-8"))
+    return os.path.join(config.args.checkdir, ".cache", "{}-{}".format(kind, sha256.hexdigest()))
+
+
+def touch(path):
+    """Creates an empty file at path, along with any missing directories."""
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError:
+        if not os.path.isdir(os.path.dirname(path)):
+            raise
+    open(path, "w").close()
+
 
-            if code:
-                raise InternalError("failed to install dependencies in ({})".format(
-                    requirements[len(config.args.checkdir) + 1:]))
+def import_bundle(slug):
+    """
+    Extract child of Check class for slug from config.bundle and return it.
+    A bundle is a zip archive laid out like a checks repository, e.g. as
+    created by `git archive --format=zip -o hello.zip <revision> path/to/check`,
+    with any pinned dependencies as wheels in a top-level wheels/ directory.
+    Support files are extracted on demand by Checks.add.
+    """
+    config.check_dir = posixpath.join(slug, "check50")
 
     try:
-        # Import module from file path directly.
-        module = imp.load_source(slug, os.path.join(config.check_dir, "__init__.py"))
-        # Ensure that there is exactly one class decending from Checks defined in this package.
-        checks, = (cls for _, cls in inspect.getmembers(module, inspect.isclass)
-                   if hasattr(cls, "_Checks__sentinel")
-                   and cls.__module__.startswith(slug))
+        with zipfile.ZipFile(config.bundle) as bundle:
+            wheels = [info for info in bundle.infolist()
+                      if info.filename.startswith("wheels/") and info.filename.endswith(".whl")]
+
+            # Only extract and install wheels this interpreter hasn't installed before.
+            sha256 = hashlib.sha256()
+            for info in sorted(wheels, key=lambda info: info.filename):
+                sha256.update("{}:{}\n".format(info.filename, info.CRC).encode("utf-8"))
+            stamp = install_stamp("wheels", sha256)
+
+            if wheels and not os.path.exists(stamp):
+                wheel_dir = tempfile.mkdtemp(dir=config.tempdir)
+                bundle.extractall(wheel_dir, wheels)
+                install(["--no-index", "--find-links", os.path.join(wheel_dir, "wheels")] +
+                        [os.path.join(wheel_dir, *info.filename.split("/")) for info in wheels],
+                        "{}/wheels".format(os.path.basename(config.bundle)))
+                touch(stamp)
+    except zipfile.BadZipfile:
+        raise InternalError("invalid bundle {}".format(config.args.bundle))
+
+    return load_checks(slug)
+
+
+def install(args, source):
+    """Install dependencies with pip, naming source on failure."""
+    args = ["install"] + args
+    # If we are not in a virtualenv, we need --user
+    if not hasattr(sys, "real_prefix"):
+        args.append("--user")
+
+    if not config.args.verbose:
+        args += ["--quiet"] * 3
+
+    try:
+        code = pip.main(args)
+    except SystemExit as e:
+        code = e.code
+
+    if code:
+        raise InternalError("failed to install dependencies in ({})".format(source))
+
+
+def load_checks(slug):
+    """Import the check module in config.check_dir and return its child of Check class."""
+    try:
+        module = load_module(slug, config.check_dir)
+        cached = config.modules[module.__file__]
+        if "checks" not in cached:
+            # Ensure that there is exactly one class decending from Checks defined in this package.
+            cached["checks"], = (cls for _, cls in inspect.getmembers(module, inspect.isclass)
+                                 if hasattr(cls, "_Checks__sentinel")
+                                 and cls.__module__.startswith(slug))
     except (OSError, IOError) as e:
         if e.errno != errno.ENOENT:
             raise
     except ValueError:
         pass
     else:
-        return checks
+        return cached["checks"]
 
     raise InternalError("invalid identifier")
 
 
 def import_from(path):
     """helper function to make it easier for a check to import another check"""
-    with cd(config.check_dir):
-        abspath = os.path.abspath(os.path.join(path, "check50", "__init__.py"))
-    return imp.load_source(os.path.basename(path), abspath)
+    if config.bundle:
+        check_dir = posixpath.normpath(posixpath.join(config.check_dir, path, "check50"))
+    else:
+        with cd(config.check_dir):
+            check_dir = os.path.abspath(os.path.join(path, "check50"))
+    return load_module(os.path.basename(path), check_dir)
+
+
+def load_module(name, check_dir):
+    """
+    Import the module in check_dir, reading it from config.bundle if there is one.
+    Modules are memoized by source hash, so importing one again (e.g., a base
+    check shared via import_from) neither recompiles nor re-executes it unless
+    it or a module it imported has changed.
+    """
+    path, digest, source, loader = read_source(check_dir)
+
+    cached = config.modules.get(path)
+    if (cached and cached["digest"] == digest
+            and all(read_source(dep)[1] == dep_digest for dep, dep_digest in cached["deps"])):
+        module = cached["module"]
+        # Re-register the checks that executing the module would have declared.
+        config.test_cases.extend(cached["test_cases"])
+    else:
+        code = compile_source(source, path, digest)
+
+        # Load under name rather than package so as not to shadow check50 itself.
+        module = imp.new_module(name)
+        module.__file__ = path
+        if loader is None and SourceFileLoader is not None:
+            loader = SourceFileLoader(name, path)
+        if loader is not None:
+            module.__loader__ = loader
+        sys.modules[name] = module
+
+        # Collect the modules this one imports (via import_from) as it executes.
+        declared = len(config.test_cases)
+        config.loading.append([])
+        try:
+            exec(code, module.__dict__)
+        finally:
+            deps = config.loading.pop()
+        cached = config.modules[path] = {
+            "digest": digest,
+            "module": module,
+            "deps": deps,
+            "test_cases": config.test_cases[declared:]
+        }
+
+    sys.modules[name] = module
+    # Record this module, and what it imported, as a dependency of its importer.
+    if config.loading:
+        config.loading[-1] += cached["deps"] + [(check_dir, digest)]
+    return module
+
+
+def read_source(check_dir):
+    """Returns the path, hash, source and (for bundles) loader of the module in check_dir."""
+    loader = None
+    if config.bundle:
+        parent, package = posixpath.split(check_dir)
+        loader = BundleLoader(zipimport.zipimporter(os.path.join(config.bundle, *parent.split("/"))),
+                              package)
+        try:
+            path = loader.get_filename(package)
+            source = loader.get_source(package)
+        except zipimport.ZipImportError:
+            raise IOError(errno.ENOENT, os.strerror(errno.ENOENT), check_dir)
+        if not isinstance(source, bytes):
+            source = source.encode("utf-8")
+    else:
+        path = os.path.join(check_dir, "__init__.py")
+        with open(path, "rb") as f:
+            source = f.read()
+
+    # Compiled code depends on the interpreter version and the filename too.
+    sha256 = hashlib.sha256(imp.get_magic())
+    sha256.update(path.encode("utf-8"))
+    sha256.update(source)
+    return path, sha256.hexdigest(), source, loader
+
+
+def compile_source(source, path, digest):
+    """Compiles source, reusing code cached in config.args.checkdir by earlier runs."""
+    cache = os.path.join(config.args.checkdir, ".cache", digest)
+    try:
+        with open(cache, "rb") as f:
+            return marshal.load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        pass
+
+    # Don't let check50's own __future__ imports leak into the checks.
+    code = compile(source, path, "exec", dont_inherit=True)
+    try:
+        if not os.path.isdir(os.path.dirname(cache)):
+            os.makedirs(os.path.dirname(cache))
+        # Write to a temporary file first so that readers never see partial code.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cache))
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump(code, f)
+        os.rename(tmp, cache)
+    except (IOError, OSError):
+        pass
+    return code
 
 
 class TestResult(unittest.TestResult):
@@ -434,6 +878,31 @@ class File(object):
             return open(file, mode, newline="\n")
 
 
+class BundleLoader(object):
+    """
+    Loader for a check module in a bundle. The module is loaded under its
+    slug rather than under the name of its package (check50), so this answers
+    for any name with that package, which linecache and inspect rely on to
+    find its source.
+    """
+
+    def __init__(self, importer, package):
+        self.importer = importer
+        self.package = package
+
+    def get_data(self, path):
+        return self.importer.get_data(path)
+
+    def get_filename(self, fullname):
+        return self.importer.get_filename(self.package)
+
+    def get_source(self, fullname):
+        return self.importer.get_source(self.package)
+
+    def is_package(self, fullname):
+        return True
+
+
 # Wrapper class for pexpect child
 class Child(object):
     def __init__(self, test, child):
@@ -441,6 +910,7 @@ class Child(object):
         self.child = child
         self.output = []
         self.exitstatus = None
+        self._capped = False
 
     def stdin(self, line, prompt=True, timeout=1):
         if line == EOF:
@@ -449,9 +919,14 @@ class Child(object):
             self.test.log.append("sending input {}...".format(line))
 
         if prompt:
+            timeout, factor = self._scale_timeout(timeout)
+            start = time.time()
             try:
                 self.child.expect(".+", timeout=timeout)
-            except (TIMEOUT, EOF):
+            except TIMEOUT:
+                self._log_timeout(start, timeout, factor)
+                raise Error("expected prompt for input, found none")
+            except EOF:
                 raise Error("expected prompt for input, found none")
 
         if line == EOF:
@@ -481,6 +956,8 @@ class Child(object):
 
         self.test.log.append("checking for output \"{}\"...".format(str_output))
 
+        timeout, factor = self._scale_timeout(timeout)
+        start = time.time()
         try:
             expect(output, timeout=timeout)
         except EOF:
@@ -489,6 +966,7 @@ class Child(object):
                 result += self.child.after
             raise Error(Mismatch(str_output, result.replace("\r\n", "\n")))
         except TIMEOUT:
+            self._log_timeout(start, timeout, factor)
             raise Error("did not find output {}".format(Mismatch.raw(str_output)))
         except UnicodeDecodeError:
             raise Error("output not valid ASCII text")
@@ -501,8 +979,99 @@ class Child(object):
 
         return self
 
+    def transcript(self, steps, timeout=1):
+        """
+        Runs a scripted transcript against the child. Each step is a tuple
+        (stream, value) or (stream, value, prompt) where stream is "stdin" or
+        "stdout". Consecutive inputs are sent in a single write and expected
+        outputs are then checked against the captured stream in order. Only
+        inputs marked with prompt=True wait for a prompt: everything before
+        them is sent and checked first, and the last expected output (if any)
+        is taken to be the prompt. Otherwise they wait for any output, as in
+        Child.stdin.
+        """
+        inputs, outputs = [], []
+        for step in steps:
+            stream, value = step[:2]
+            prompt = len(step) > 2 and step[2]
+            if stream == "stdout":
+                outputs.append(value)
+            elif stream != "stdin":
+                raise InternalError("invalid stream \"{}\" in transcript".format(stream))
+            elif prompt:
+                # Checking the preceding output already consumed the prompt.
+                self._flush(inputs, outputs, timeout)
+                self.stdin(value, prompt=not outputs, timeout=timeout)
+                inputs, outputs = [], []
+            else:
+                inputs.append(value)
+
+        self._flush(inputs, outputs, timeout)
+        return self
+
+    def _flush(self, inputs, outputs, timeout):
+        """Send buffered inputs all at once, then check buffered outputs in order."""
+        data = []
+        for line in inputs:
+            if line == EOF:
+                self.test.log.append("sending EOF...")
+                data.append(termios.tcgetattr(self.child.child_fd)[6][termios.VEOF])
+            else:
+                self.test.log.append("sending input {}...".format(line))
+                data.append((line + os.linesep).encode("utf-8"))
+        self._send(b"".join(data), timeout)
+
+        for output in outputs:
+            self.stdout(output, timeout=timeout)
+
+    def _send(self, data, timeout):
+        """
+        Write data to the child without blocking, reading its output into the
+        pexpect buffer meanwhile, so that a program blocked on writing output
+        can't deadlock with check50 blocked on writing its input. Times out if
+        neither side makes progress for timeout seconds.
+        """
+        timeout, factor = self._scale_timeout(timeout)
+        if timeout is not None and timeout < 0:
+            timeout = self.child.timeout
+        fd = self.child.child_fd
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        try:
+            start = time.time()
+            while data:
+                remaining = None if timeout is None else max(0, start + timeout - time.time())
+                readable, writable, _ = select.select([fd], [fd], [], remaining)
+                if not readable and not writable:
+                    self._log_timeout(start, timeout, factor)
+                    raise Error("timed out while sending input")
+
+                if readable:
+                    try:
+                        self.child.buffer += self.child.read_nonblocking(size=1024, timeout=0)
+                    except TIMEOUT:
+                        pass
+                    except EOF:
+                        # Program exited, so there's no one left to read the rest.
+                        return
+                    else:
+                        start = time.time()
+
+                if writable:
+                    try:
+                        data = data[os.write(fd, data[:1024]):]
+                    except OSError as e:
+                        if e.errno != errno.EAGAIN:
+                            return
+                    else:
+                        start = time.time()
+        finally:
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+
     def reject(self, timeout=1):
         self.test.log.append("checking that input was rejected...")
+        timeout, factor = self._scale_timeout(timeout)
+        start = time.time()
         try:
             self.child.expect(".+", timeout=timeout)
             self.child.sendline("")
@@ -511,6 +1080,7 @@ class Child(object):
         except OSError:
             self.test.fail()
         except TIMEOUT:
+            self._log_timeout(start, timeout, factor)
             raise Error("timed out while waiting for input to be rejected")
         return self
 
@@ -526,7 +1096,9 @@ class Child(object):
         return self
 
     def wait(self, timeout=1):
-        end = time.time() + timeout
+        timeout, factor = self._scale_timeout(timeout)
+        start = time.time()
+        end = start + timeout
         while time.time() <= end:
             if not self.child.isalive():
                 break
@@ -539,6 +1111,7 @@ class Child(object):
             else:
                 self.output.append(bytes)
         else:
+            self._log_timeout(start, timeout, factor)
             raise Error("timed out while waiting for program to exit")
 
         # Read any remaining data in pipe.
@@ -559,6 +1132,20 @@ class Child(object):
         self.child.close(force=True)
         return self
 
+    def _scale_timeout(self, timeout):
+        """Scales timeout as scale_timeout does, noting (once) if the load factor was capped."""
+        timeout, factor = scale_timeout(timeout)
+        if factor == MAX_LOAD_FACTOR and not self._capped:
+            self._capped = True
+            self.test.log.append("load factor capped at {:.2f}, machine is heavily loaded".format(
+                MAX_LOAD_FACTOR))
+        return timeout, factor
+
+    def _log_timeout(self, start, timeout, factor):
+        """Record how long we actually waited, to tell slow programs apart from slow machines."""
+        self.test.log.append("timed out after {:.2f}s (timeout {:.2f}s, load factor {:.2f})".format(
+            time.time() - start, timeout, factor))
+
 
 class Checks(unittest.TestCase):
     PASS = True
@@ -568,6 +1155,9 @@ class Checks(unittest.TestCase):
     _valgrind_log = "valgrind.xml"
     _valgrind = False
 
+    # Set to True in a subclass to run `python file.py` commands in pre-spawned interpreters.
+    zygote = False
+
     # Here so we can properly check subclasses even when child is imported from another module.
     __sentinel = None
 
@@ -629,15 +1219,28 @@ class Checks(unittest.TestCase):
 
         if env is None:
             env = {}
-        env = os.environ.update(env)
+        os.environ.update(env)
+
+        args = split_command(cmd)
+        child = None
+        # Pre-spawned interpreters have already read any PYTHON* variables.
+        if (self.zygote and not self._valgrind and args and len(args) > 1
+                and re.match(r"python[\d.]*$", os.path.basename(args[0]))
+                and args[1].endswith(".py")
+                and not any(key.startswith("PYTHON") for key in env)):
+            child = zygote(args)
+        elif args and which(args[0]) and sys.platform != "darwin":
+            # No shell features needed, so skip the bash wrapper.
+            try:
+                child = pty_spawn(args[0], args[1:])
+            except (OSError, pexpect.ExceptionPexpect):
+                # e.g., a script without a shebang, which only a shell will run.
+                pass
 
-        # Workaround for OSX pexpect bug http://pexpect.readthedocs.io/en/stable/commonissues.html#truncated-output-just-before-child-exits
-        # Workaround from https://github.com/pexpect/pexpect/issues/373
-        cmd = "bash -c {}".format(quote(cmd))
-        if sys.version_info < (3, 0):
-            child = pexpect.spawn(cmd, echo=False, env=env)
-        else:
-            child = pexpect.spawnu(cmd, encoding="utf-8", echo=False, env=env)
+        if child is None:
+            # Workaround for OSX pexpect bug http://pexpect.readthedocs.io/en/stable/commonissues.html#truncated-output-just-before-child-exits
+            # Workaround from https://github.com/pexpect/pexpect/issues/373
+            child = pty_spawn("bash -c {}".format(quote(cmd)))
 
         self.children.append(Child(self, child))
         return self.children[-1]
@@ -645,6 +1248,11 @@ class Checks(unittest.TestCase):
     def add(self, *paths):
         """Copies a file to the temporary directory."""
         cwd = os.getcwd()
+        if config.bundle:
+            for path in paths:
+                extract(path, cwd)
+            return
+
         with cd(config.check_dir):
             for path in paths:
                 copy(path, cwd)
@@ -1,6 +1,10 @@
 # https://docs.python.org/3/faq/programming.html#how-do-i-share-global-variables-across-modules
 args = None
+bundle = None
 check_dir = None
+loading = []
+modules = {}
 tempdir = None
 test_cases = []
 test_results = {}
+zygotes = {}